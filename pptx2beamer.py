@@ -7,15 +7,57 @@
 import sys
 import os
 import argparse
+import functools
+import io
 import zipfile
 import shutil
-import tempfile
 import subprocess
-import xml.etree.ElementTree as ET
 from pathlib import Path
 from datetime import datetime
 import re
 
+# Prefer lxml's C-backed parser when available; fall back to the stdlib.
+# PPTX files are untrusted input: lxml is told never to expand entities or
+# touch the network, and to drop comments/PIs we never read. The stdlib
+# parser doesn't load external entities and relies on expat's (>= 2.4.1)
+# built-in limits against entity-expansion bombs.
+try:
+    import lxml.etree as ET
+    _PARSER_OPTIONS = {
+        'resolve_entities': False,
+        'no_network': True,
+        'remove_comments': True,
+        'remove_pis': True,
+        'huge_tree': False,
+        'collect_ids': False,
+    }
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _PARSER_OPTIONS = {}
+
+NS = {
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+}
+
+# Pre-expanded {uri}local names for the slide-content lookups, so find/findall
+# don't have to resolve namespace prefixes on every call.
+_NS_P = f"{{{NS['p']}}}"
+_NS_A = f"{{{NS['a']}}}"
+_SP = f'{_NS_P}sp'
+_PIC = f'{_NS_P}pic'
+_T = f'.//{_NS_A}t'
+_PH = f'.//{_NS_P}nvPr/{_NS_P}ph'
+_BLIP = f'.//{_NS_P}blipFill/{_NS_A}blip'
+_BLIP_ALT = f'.//{_NS_A}blip'
+_XFRM = f'.//{_NS_A}xfrm'
+_OFF = f'.//{_NS_A}off'
+_EXT = f'.//{_NS_A}ext'
+_EMBED = f"{{{NS['r']}}}embed"
+_PH_TYPE = 'type'
+_RELATIONSHIP = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+
 def sanitize_for_latex(text):
     """Remove characters that are invalid for LaTeX command names."""
     sanitized = re.sub(r'[^a-zA-Z0-9]', '', text)
@@ -24,128 +66,157 @@ def sanitize_for_latex(text):
     import hashlib
     return "layout" + hashlib.md5(text.encode('utf-8')).hexdigest()[:8]
 
+_LATEX_ESCAPES = {
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+}
+_LATEX_ESCAPE_RE = re.compile('[' + re.escape(''.join(_LATEX_ESCAPES)) + ']')
+
+@functools.lru_cache(maxsize=4096)
+def _escape_latex(text):
+    """Cached core of escape_latex; titles and short strings repeat a lot."""
+    return _LATEX_ESCAPE_RE.sub(lambda m: _LATEX_ESCAPES[m.group()], text)
+
 def escape_latex(text):
     """Escape LaTeX special characters in text."""
-    if text is None:
+    if not text:
         return ""
-    replacements = {
-        "\\": r"\textbackslash{}",
-        "&": r"\&",
-        "%": r"\%",
-        "$": r"\$",
-        "#": r"\#",
-        "_": r"\_",
-        "{": r"\{",
-        "}": r"\}",
-        "~": r"\textasciitilde{}",
-        "^": r"\textasciicircum{}",
-    }
-    return "".join(replacements.get(ch, ch) for ch in text)
+    return _escape_latex(text)
+
+def media_file_name(name):
+    """Name a media file is stored under in fig/ (.jfif is renamed to .jpg)."""
+    if name.lower().endswith('.jfif'):
+        return name[:-5] + ".jpg"
+    return name
 
 # --- XML Parsing Functions ---
 
-def parse_slides_for_content(ppt_dir):
-    """Parses actual slides to extract images and their positions and texts."""
-    slides_data = []
-    ns = {
-        'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
-        'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-        'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+def _xml_parser():
+    """Return a fresh XML parser for the active ElementTree backend."""
+    return ET.XMLParser(**_PARSER_OPTIONS)
+
+def _handle_sp(sp, slide_info):
+    """Records the title or body text of a single p:sp shape."""
+    ph = sp.find(_PH)
+    ph_type = ph.get(_PH_TYPE) if ph is not None else None
+
+    text = "".join(t.text for t in sp.iterfind(_T) if t.text).strip()
+    if not text:
+        return
+
+    if ph_type in ('title', 'ctrTitle'):
+        if slide_info['title'].startswith("Slide "):
+            slide_info['title'] = text
+        return
+    if ph_type == 'subtitle':
+        # Subtitle is handled by title page parsing
+        return
+
+    slide_info['texts'].append(text)
+
+def _handle_pic(pic, slide_info, rels):
+    """Records the image file and position of a single p:pic shape."""
+    blip = pic.find(_BLIP)
+    if blip is None:
+        blip = pic.find(_BLIP_ALT)
+    if blip is None:
+        return
+
+    rId = blip.get(_EMBED)
+    if rId not in rels:
+        return
+    img_path = rels[rId]
+
+    # Extract coordinates (xfrm)
+    position = {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+    xfrm = pic.find(_XFRM)
+    if xfrm is not None:
+        off = xfrm.find(_OFF)
+        ext = xfrm.find(_EXT)
+        if off is not None:
+            attrib = off.attrib
+            position['x'] = int(attrib.get('x', '0'))
+            position['y'] = int(attrib.get('y', '0'))
+        if ext is not None:
+            attrib = ext.attrib
+            position['width'] = int(attrib.get('cx', '0'))
+            position['height'] = int(attrib.get('cy', '0'))
+
+    slide_info['images'].append({
+        'name': img_path,
+        'position': position
+    })
+
+@functools.lru_cache(maxsize=None)
+def _load_rels(rels_xml):
+    """Maps relationship IDs to fig/ file names for one slide .rels part.
+
+    Cached on the raw XML: slides built from the same layout and images
+    often have byte-identical .rels parts. Names are interned so repeated
+    logos/footers share one string.
+    """
+    rel_root = ET.fromstring(rels_xml, _xml_parser())
+    return {
+        r.get('Id'): sys.intern(media_file_name(r.get('Target').split('/')[-1]))
+        for r in rel_root.findall(_RELATIONSHIP) if r.get('Target')
     }
-    
-    slide_dir = ppt_dir / 'ppt' / 'slides'
-    if not slide_dir.exists():
-        return slides_data
-        
-    # Get sorted slide files
-    slide_files = sorted(slide_dir.glob('slide*.xml'), 
-                        key=lambda x: int(re.search(r'slide(\d+)\.xml', x.name).group(1)))
-    
-    for slide_file in slide_files:
-        slide_num = re.search(r'slide(\d+)\.xml', slide_file.name).group(1)
-        rels_file = slide_dir / '_rels' / f'{slide_file.name}.rels'
-        
-        slide_info = {
-            'number': slide_num,
-            'images': [],
-            'title': f"Slide {slide_num}",
-            'texts': []
-        }
-        
-        if not rels_file.exists():
-            slides_data.append(slide_info)
-            continue
-            
-        # Parse relationships to resolve image IDs
-        rel_tree = ET.parse(rels_file)
-        rel_root = rel_tree.getroot()
-        rels = {r.get('Id'): r.get('Target') for r in rel_root.findall('{http://schemas.openxmlformats.org/package/2006/relationships}Relationship')}
-        
-        try:
-            tree = ET.parse(slide_file)
-            root = tree.getroot()
-            
-            # Find title and body text
-            for sp in root.findall('.//p:sp', ns):
-                ph = sp.find('.//p:nvPr/p:ph', ns)
-                ph_type = ph.get('type') if ph is not None else None
-
-                texts = [t.text for t in sp.findall('.//a:t', ns) if t.text]
-                if not texts:
-                    continue
-                text = "".join(texts).strip()
-                if not text:
-                    continue
 
-                if ph_type in ('title', 'ctrTitle'):
-                    if slide_info['title'].startswith("Slide "):
-                        slide_info['title'] = text
-                    continue
-                if ph_type == 'subtitle':
-                    # Subtitle is handled by title page parsing
-                    continue
+def _parse_one_slide(slide_xml, rels_xml, slide_num):
+    """Parses one slide's XML bytes (and its .rels bytes, or None) into a slide_info dict."""
+    slide_info = {
+        'number': slide_num,
+        'images': [],
+        'title': f"Slide {slide_num}",
+        'texts': []
+    }
+
+    if rels_xml is None:
+        return slide_info
+
+    # Parse relationships to resolve image IDs
+    rels = _load_rels(rels_xml)
+
+    try:
+        # Single pass: handle each shape as soon as it is complete, then
+        # clear its children since nothing reads them again.
+        for _, elem in ET.iterparse(io.BytesIO(slide_xml), events=('end',), **_PARSER_OPTIONS):
+            tag = elem.tag
+            if tag == _SP:
+                _handle_sp(elem, slide_info)
+                elem.clear()
+            elif tag == _PIC:
+                _handle_pic(elem, slide_info, rels)
+                elem.clear()
+    except Exception:
+        pass
+
+    return slide_info
+
+def parse_slides_for_content(zip_ref):
+    """Parses actual slides to extract images and their positions and texts."""
+    names = set(zip_ref.namelist())
+
+    # Get sorted slide parts; names are always "ppt/slides/slide<N>.xml"
+    prefix = 'ppt/slides/slide'
+    slide_names = sorted((n for n in names if n.startswith(prefix) and n.endswith('.xml')),
+                         key=lambda n: int(n[len(prefix):-4]))
+    slides_data = []
+    for name in slide_names:
+        rels_name = f'ppt/slides/_rels/{name[len("ppt/slides/"):]}.rels'
+        rels_xml = zip_ref.read(rels_name) if rels_name in names else None
+        slides_data.append(_parse_one_slide(zip_ref.read(name), rels_xml, name[len(prefix):-4]))
 
-                slide_info['texts'].append(text)
-            
-            # Find all pictures on the slide
-            for pic in root.findall('.//p:pic', ns):
-                blip = pic.find('.//p:blipFill/a:blip', ns)
-                if blip is None:
-                    blip = pic.find('.//a:blip', ns)
-                
-                if blip is not None:
-                    rId = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                    if rId in rels:
-                        img_path = rels[rId].split('/')[-1]
-                        lower_img = img_path.lower()
-                        if lower_img.endswith('.jfif'):
-                            img_path = img_path[:-5] + ".jpg"
-                        
-                        # Extract coordinates (xfrm)
-                        position = {'x': 0, 'y': 0, 'width': 0, 'height': 0}
-                        xfrm = pic.find('.//a:xfrm', ns)
-                        if xfrm is not None:
-                            off = xfrm.find('.//a:off', ns)
-                            ext = xfrm.find('.//a:ext', ns)
-                            if off is not None:
-                                position['x'] = int(off.get('x', 0))
-                                position['y'] = int(off.get('y', 0))
-                            if ext is not None:
-                                position['width'] = int(ext.get('cx', 0))
-                                position['height'] = int(ext.get('cy', 0))
-                                
-                        slide_info['images'].append({
-                            'name': img_path,
-                            'position': position
-                        })
-        except Exception:
-            pass
-            
-        slides_data.append(slide_info)
-        
     return slides_data
 
-def parse_title_page_info(ppt_dir):
+def parse_title_page_info(zip_ref):
     """Extracts title/subtitle/author/institute/date from the first slide."""
     info = {
         'title': '',
@@ -154,28 +225,17 @@ def parse_title_page_info(ppt_dir):
         'institute': '',
         'date': ''
     }
-    ns = {
-        'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
-        'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'
-    }
-
-    slide_path = ppt_dir / 'ppt' / 'slides' / 'slide1.xml'
-    if not slide_path.exists():
-        return info
 
     try:
-        tree = ET.parse(slide_path)
-        root = tree.getroot()
+        # A missing slide1.xml raises KeyError and leaves info empty
+        root = ET.fromstring(zip_ref.read('ppt/slides/slide1.xml'), _xml_parser())
 
-        for sp in root.findall('.//p:sp', ns):
-            ph = sp.find('.//p:nvPr/p:ph', ns)
+        for sp in root.findall('.//p:sp', NS):
+            ph = sp.find('.//p:nvPr/p:ph', NS)
             if ph is None:
                 continue
-            ph_type = ph.get('type', '')
-            texts = [t.text for t in sp.findall('.//a:t', ns) if t.text]
-            if not texts:
-                continue
-            text = "".join(texts).strip()
+            ph_type = ph.get(_PH_TYPE, '')
+            text = "".join(t.text for t in sp.iterfind('.//a:t', NS) if t.text).strip()
             if not text:
                 continue
 
@@ -212,20 +272,16 @@ def convert_ppt_to_beamer_position(position, paper_width=12192000, paper_height=
         'height_rel': height_rel
     }
 
-def parse_presentation_xml(ppt_dir):
+def parse_presentation_xml(zip_ref):
     """Parses presentation.xml for slide size."""
-    ns = {'p': 'http://schemas.openxmlformats.org/presentationml/2006/main'}
-    pres_xml = ppt_dir / "ppt" / "presentation.xml"
     size = {'width': 12192000, 'height': 6858000}
-    if pres_xml.exists():
-        try:
-            tree = ET.parse(pres_xml)
-            root = tree.getroot()
-            sldSz = root.find('.//p:sldSz', ns)
-            if sldSz is not None:
-                size['width'] = int(sldSz.get('cx', 12192000))
-                size['height'] = int(sldSz.get('cy', 6858000))
-        except: pass
+    try:
+        root = ET.fromstring(zip_ref.read("ppt/presentation.xml"), _xml_parser())
+        sldSz = root.find('.//p:sldSz', NS)
+        if sldSz is not None:
+            size['width'] = int(sldSz.get('cx', 12192000))
+            size['height'] = int(sldSz.get('cy', 6858000))
+    except: pass
     return size
 
 def is_full_slide_background(pos_rel, tol=0.02):
@@ -237,60 +293,77 @@ def is_full_slide_background(pos_rel, tol=0.02):
         pos_rel['height_rel'] >= (1.0 - tol)
     )
 
+_FRAME_TEMPLATE = (
+    "% Slide {num}\n"
+    "\\begin{{frame}}{{{title}}}\n"
+    "{items}"
+    "{images}"
+    "\\end{{frame}}\n\n"
+)
+_ITEMIZE_TEMPLATE = "  \\begin{{itemize}}\n{items}  \\end{{itemize}}\n"
+_IMAGE_TEMPLATE = (
+    "  \\begin{{center}}\n"
+    "    \\includegraphics[width=0.85\\linewidth]{{{path}}}\n"
+    "  \\end{{center}}\n"
+)
+
 def generate_main_tex(output_dir, slides_content, paper_width, paper_height, title_info):
     """Generates the main .tex file using the SWIFT_lecture_notes template structure."""
     filepath = output_dir / "overview_eng.tex"
-    with open(filepath, 'w') as f:
-        f.write(r"\documentclass{beamer}" + "\n")
-        f.write(r"\input{../0-package.tex}" + "\n")
-        f.write(r"\input{../0-macro.tex}" + "\n\n")
-        
-        f.write(rf"\author{{{escape_latex(title_info.get('author', ''))}}}" + "\n")
-        f.write(rf"\title{{{escape_latex(title_info.get('title', ''))}}}" + "\n")
-        f.write(rf"\subtitle{{{escape_latex(title_info.get('subtitle', ''))}}}" + "\n")
-        f.write(rf"\institute{{{escape_latex(title_info.get('institute', ''))}}}" + "\n")
-        f.write(rf"\date{{{escape_latex(title_info.get('date', ''))}}}" + "\n")
-        f.write("\n")
-        
-        f.write(r"\begin{document}" + "\n\n")
-        f.write(r"\kaishu" + "\n")
-        f.write(r"\begin{frame}" + "\n")
-        f.write(r"    \titlepage" + "\n")
-      
-        f.write(r"\end{frame}" + "\n\n")
-        
-        if slides_content:
-            for slide in slides_content:
-                if str(slide['number']) == "1":
+    parts = []
+    append = parts.append
+    append(r"\documentclass{beamer}" + "\n")
+    append(r"\input{../0-package.tex}" + "\n")
+    append(r"\input{../0-macro.tex}" + "\n\n")
+
+    append(rf"\author{{{escape_latex(title_info.get('author', ''))}}}" + "\n")
+    append(rf"\title{{{escape_latex(title_info.get('title', ''))}}}" + "\n")
+    append(rf"\subtitle{{{escape_latex(title_info.get('subtitle', ''))}}}" + "\n")
+    append(rf"\institute{{{escape_latex(title_info.get('institute', ''))}}}" + "\n")
+    append(rf"\date{{{escape_latex(title_info.get('date', ''))}}}" + "\n")
+    append("\n")
+
+    append(r"\begin{document}" + "\n\n")
+    append(r"\kaishu" + "\n")
+    append(r"\begin{frame}" + "\n")
+    append(r"    \titlepage" + "\n")
+    append(r"\end{frame}" + "\n\n")
+
+    if slides_content:
+        for slide in slides_content:
+            if str(slide['number']) == "1":
+                continue
+
+            items = ""
+            if slide['texts']:
+                items = _ITEMIZE_TEMPLATE.format(items="".join(
+                    f"    \\item {escape_latex(text)}\n" for text in slide['texts']))
+
+            images = []
+            for img in slide['images']:
+                img_path = img['name']
+                lower_img = img_path.lower()
+                if lower_img.endswith(('.tiff', '.tif')):
+                    continue
+                pos = convert_ppt_to_beamer_position(img['position'], paper_width, paper_height)
+                if is_full_slide_background(pos):
                     continue
-                f.write(f"% Slide {slide['number']}\n")
-                f.write(r"\begin{frame}" + f"{{{escape_latex(slide['title'])}}}\n")
-                
-                if slide['texts']:
-                    f.write(r"  \begin{itemize}" + "\n")
-                    for text in slide['texts']:
-                        f.write(f"    \\item {escape_latex(text)}\n")
-                    f.write(r"  \end{itemize}" + "\n")
-
-                for img in slide['images']:
-                    pos = convert_ppt_to_beamer_position(img['position'], paper_width, paper_height)
-                    img_path = img['name']
-                    if img_path.lower().endswith('.emf'):
-                        img_path = img_path.replace('.emf', '.pdf')
-                    if img_path.lower().endswith(('.tiff', '.tif')):
-                        continue
-
-                        img_path = f"fig/{img_path}"
-
-                    if is_full_slide_background(pos):
-                        continue
-
-                    f.write(r"  \begin{center}" + "\n")
-                    f.write(f"    \\includegraphics[width=0.85\\linewidth]{{{img_path}}}\n")
-                    f.write(r"  \end{center}" + "\n")
-                f.write(r"\end{frame}" + "\n\n")
-        
-        f.write(r"\end{document}" + "\n")
+                if lower_img.endswith('.emf'):
+                    img_path = img_path.replace('.emf', '.pdf')
+
+                # Bare file name: 0-package.tex sets \graphicspath{{fig/}}
+                images.append(_IMAGE_TEMPLATE.format(path=img_path))
+
+            append(_FRAME_TEMPLATE.format(
+                num=slide['number'],
+                title=escape_latex(slide['title']),
+                items=items,
+                images="".join(images),
+            ))
+
+    append(r"\end{document}" + "\n")
+    with open(filepath, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("".join(parts))
 
 # --- Main Function ---
 
@@ -336,19 +409,24 @@ def main():
 
     # Copy template files from SWIFT_lecture_notes
     template_dir = Path("/Users/miranda/git/pptx2beamer/template")
+    # scandir caches the file type, and copyfile skips the metadata syscalls
+    # of copy2 (timestamps/permissions of template files don't matter).
     if template_dir.exists():
-        for item in template_dir.iterdir():
-            if item.name == "main.tex": continue
-            if item.is_dir():
-                if item.name == "pic":
-                    shutil.copytree(item, output_dir.parent / item.name, dirs_exist_ok=True)
-                else:
-                    shutil.copytree(item, output_dir / item.name, dirs_exist_ok=True)
-            else:
-                if item.suffix == ".sty":
-                    shutil.copy2(item, output_dir.parent / item.name)
+        with os.scandir(template_dir) as entries:
+            for entry in entries:
+                if entry.name == "main.tex": continue
+                if entry.is_dir():
+                    if entry.name == "pic":
+                        shutil.copytree(entry.path, output_dir.parent / entry.name,
+                                        copy_function=shutil.copyfile, dirs_exist_ok=True)
+                    else:
+                        shutil.copytree(entry.path, output_dir / entry.name,
+                                        copy_function=shutil.copyfile, dirs_exist_ok=True)
                 else:
-                    shutil.copy2(item, output_dir / item.name)
+                    if os.path.splitext(entry.name)[1] == ".sty":
+                        shutil.copyfile(entry.path, output_dir.parent / entry.name)
+                    else:
+                        shutil.copyfile(entry.path, output_dir / entry.name)
 
     # Write shared package/macro files in parent directory
     write_shared_tex_files(output_dir.parent)
@@ -357,30 +435,30 @@ def main():
     fig_dir = output_dir / "fig"
     fig_dir.mkdir(parents=True, exist_ok=True)
 
-    # Process PowerPoint file
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        with zipfile.ZipFile(args.pptx_file, 'r') as zip_ref:
-            zip_ref.extractall(temp_path)
-
-        slide_size = parse_presentation_xml(temp_path)
+    # Process PowerPoint file; XML is parsed straight from the archive
+    with zipfile.ZipFile(args.pptx_file, 'r') as zip_ref:
+        slide_size = parse_presentation_xml(zip_ref)
         paper_width = slide_size['width']
         paper_height = slide_size['height']
-        slides_content = parse_slides_for_content(temp_path)
-        title_info = parse_title_page_info(temp_path)
-
-        # Copy media files into fig/<filename>
-        media_path = temp_path / "ppt" / "media"
-        if media_path.exists():
-            for media_file in media_path.iterdir():
-                if media_file.is_file():
-                    target_name = media_file.name
-                    if target_name.lower().endswith('.jfif'):
-                        target_name = target_name[:-5] + ".jpg"
-                    shutil.copy2(media_file, fig_dir / target_name)
-
-        # Generate final tex
-        generate_main_tex(output_dir, slides_content, paper_width, paper_height, title_info)
+        slides_content = parse_slides_for_content(zip_ref)
+        title_info = parse_title_page_info(zip_ref)
+
+        # Stream media files straight from the archive into fig/<filename>
+        fig_path = str(fig_dir)
+        for zi in zip_ref.infolist():
+            if not zi.filename.startswith('ppt/media/'):
+                continue
+            # Entry names are untrusted: keep only the last component (either
+            # separator) and refuse anything that could leave fig/.
+            name = re.split(r'[\\/]', zi.filename)[-1]
+            if name in ('', '.', '..') or ':' in name:
+                continue
+            target = os.path.join(fig_path, media_file_name(name))
+            with zip_ref.open(zi) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, min(zi.file_size, 1 << 20))
+
+    # Generate final tex
+    generate_main_tex(output_dir, slides_content, paper_width, paper_height, title_info)
 
     print(f"\n🎉 Content extracted into: {output_dir}/")
     print(f"Template files from SWIFT_lecture_notes copied.")